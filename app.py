@@ -3,7 +3,11 @@ import pandas as pd
 import plotly.express as px
 from datetime import datetime, date
 import hashlib
+import hmac
 import sqlite3
+import threading
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 
 # =========================================
 # 🔧 CONFIGURAÇÃO INICIAL
@@ -20,23 +24,45 @@ st.set_page_config(
 # 🗄️ CONEXÃO COM BANCO DE DADOS
 # =========================================
 
+# Incrementar ao alterar o schema criado em init_db()
+SCHEMA_VERSION = 1
+
+class DBError(Exception):
+    """Erro de acesso ao banco de dados"""
+
+@st.cache_resource
 def get_connection():
-    """Conexão com SQLite para Streamlit Sharing"""
+    """Conexão com SQLite para Streamlit Sharing (única, compartilhada entre reruns)"""
     try:
-        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        conn = sqlite3.connect(':memory:', check_same_thread=False,
+                               cached_statements=256)
         conn.row_factory = sqlite3.Row
+        # Banco em memória: WAL/synchronous/mmap não se aplicam
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA cache_size = -20000')
         return conn
     except Exception as e:
-        st.error(f"Erro de conexão: {str(e)}")
-        return None
+        raise DBError(f"Erro de conexão: {str(e)}") from e
+
+@st.cache_resource
+def get_db_lock():
+    """Lock que serializa as transações na conexão compartilhada"""
+    return threading.Lock()
 
 def init_db():
-    """Inicializa o banco de dados"""
+    """Inicializa o banco de dados; retorna True se o schema foi criado agora"""
     conn = get_connection()
-    if conn:
-        try:
+    try:
+        # Transação exclusiva: commit ao sair, rollback em caso de erro
+        with get_db_lock(), conn:
             cur = conn.cursor()
             
+            # Schema já criado nesta conexão
+            cur.execute('PRAGMA user_version')
+            if cur.fetchone()[0] >= SCHEMA_VERSION:
+                return False
+            
             # Tabela de usuários
             cur.execute('''
                 CREATE TABLE IF NOT EXISTS usuarios (
@@ -61,64 +87,105 @@ def init_db():
                 )
             ''')
             
-            # Inserir usuário admin padrão
-            cur.execute('''
+            # Inserir usuários padrão
+            usuarios_padrao = [
+                ('admin', _ADMIN_HASH, 'Administrador', 'admin'),
+            ]
+            cur.executemany('''
                 INSERT OR IGNORE INTO usuarios (username, password, nome, tipo)
                 VALUES (?, ?, ?, ?)
-            ''', ('admin', 'admin123', 'Administrador', 'admin'))
-            
-            conn.commit()
-            st.success("Banco de dados inicializado!")
+            ''', usuarios_padrao)
             
-        except Exception as e:
-            st.error(f"Erro ao criar tabelas: {str(e)}")
-        finally:
-            conn.close()
+            cur.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        return True
+        
+    except Exception as e:
+        raise DBError(f"Erro ao criar tabelas: {str(e)}") from e
 
 # =========================================
 # 🔐 SISTEMA DE LOGIN SIMPLIFICADO
 # =========================================
 
+# Argon2id com custo fixo: latência de login previsível
+_PH = PasswordHasher(time_cost=2, memory_cost=19 * 1024, parallelism=1)
+
+# Hash pré-calculado da senha padrão do admin ('admin123')
+_ADMIN_HASH = '$argon2id$v=19$m=19456,t=2,p=1$Y1j3pLwP3BF70mQnEMTWZA$yZLweHVkhzu1OVdGp9VPxbKcpEobl0XheyZpYAWwKLU'
+
+# Hash descartável verificado quando o usuário não existe (tempo constante)
+_DUMMY_HASH = '$argon2id$v=19$m=19456,t=2,p=1$18e3jum4xp2jQUxwxUeggw$XLnlJJ0R+NbIAUoW9J3/eL6lhcySWPeCDQO1mEaYhoc'
+
+def make_hashes(password):
+    """Gera o hash Argon2id (formato PHC) da senha"""
+    return _PH.hash(password)
+
+def check_hashes(password, hashed_text):
+    """Verifica a senha contra o hash Argon2id armazenado"""
+    try:
+        return _PH.verify(hashed_text, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
 def verificar_login(username, password):
     """Verifica se o usuário e senha estão corretos"""
-    conn = get_connection()
-    if not conn:
-        return False, "Erro de conexão"
-    
     try:
+        conn = get_connection()
         cur = conn.cursor()
-        cur.execute('SELECT * FROM usuarios WHERE username = ? AND password = ?', 
-                   (username, password))
+        cur.execute('SELECT id, password, nome FROM usuarios WHERE username = ? LIMIT 1',
+                   (username,))
         usuario = cur.fetchone()
         
-        if usuario:
-            return True, usuario['nome']
+        if not usuario:
+            check_hashes(password, _DUMMY_HASH)
+            return False, "Credenciais inválidas"
+        
+        senha_salva = usuario['password']
+        # Qualquer variante Argon2 ($argon2id$, $argon2i$, $argon2d$) é hash
+        legado = not senha_salva.startswith('$argon2')
+        if legado:
+            # Senha legada em texto puro: migra para Argon2id no login
+            sucesso = hmac.compare_digest(senha_salva.encode('utf-8'),
+                                          password.encode('utf-8'))
+            if not sucesso:
+                check_hashes(password, _DUMMY_HASH)
         else:
+            sucesso = check_hashes(password, senha_salva)
+        
+        if not sucesso:
             return False, "Credenciais inválidas"
+        
+        if legado or _PH.check_needs_rehash(senha_salva):
+            novo_hash = make_hashes(password)
+            with get_db_lock(), conn:
+                conn.execute('UPDATE usuarios SET password = ? WHERE id = ?',
+                             (novo_hash, usuario['id']))
+        
+        return True, usuario['nome']
+    except DBError as e:
+        return False, str(e)
     except Exception as e:
         return False, f"Erro: {str(e)}"
-    finally:
-        conn.close()
 
 def login():
     """Interface de login"""
     st.sidebar.title("🔐 Login")
-    username = st.sidebar.text_input("Usuário")
-    password = st.sidebar.text_input("Senha", type='password')
+    username = st.sidebar.text_input("Usuário", key="login_username")
+    password = st.sidebar.text_input("Senha", type='password', key="login_password")
     
-    if st.sidebar.button("Entrar"):
-        if username and password:
-            sucesso, mensagem = verificar_login(username, password)
-            if sucesso:
-                st.session_state.logged_in = True
-                st.session_state.username = username
-                st.session_state.nome_usuario = mensagem
-                st.sidebar.success(f"Bem-vindo, {mensagem}!")
-                st.rerun()
-            else:
-                st.sidebar.error(mensagem)
-        else:
+    if st.sidebar.button("Entrar", key="login_submit"):
+        if not all((username, password)):
             st.sidebar.error("Preencha todos os campos")
+            return
+        
+        sucesso, mensagem = verificar_login(username, password)
+        if sucesso:
+            st.session_state.logged_in = True
+            st.session_state.username = username
+            st.session_state.nome_usuario = mensagem
+            st.sidebar.success(f"Bem-vindo, {mensagem}!")
+            st.rerun()
+        else:
+            st.sidebar.error(mensagem)
 
 # =========================================
 # 🎯 PÁGINA PRINCIPAL
@@ -146,15 +213,15 @@ def mostrar_dashboard():
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        if st.button("📝 Novo Pedido", use_container_width=True):
+        if st.button("📝 Novo Pedido", key="acao_novo_pedido", use_container_width=True):
             st.info("Funcionalidade em desenvolvimento")
     
     with col2:
-        if st.button("👕 Cadastrar Produto", use_container_width=True):
+        if st.button("👕 Cadastrar Produto", key="acao_cadastrar_produto", use_container_width=True):
             st.info("Funcionalidade em desenvolvimento")
     
     with col3:
-        if st.button("👥 Novo Cliente", use_container_width=True):
+        if st.button("👥 Novo Cliente", key="acao_novo_cliente", use_container_width=True):
             st.info("Funcionalidade em desenvolvimento")
 
 # =========================================
@@ -165,10 +232,13 @@ def mostrar_dashboard():
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
 
-# Inicializar banco na primeira execução
-if 'db_initialized' not in st.session_state:
-    init_db()
-    st.session_state.db_initialized = True
+# Inicializar banco (no-op se o schema já estiver na versão atual)
+try:
+    if init_db():
+        st.success("Banco de dados inicializado!")
+except DBError as e:
+    st.error(str(e))
+    st.stop()
 
 # Verificar login
 if not st.session_state.logged_in:
@@ -180,8 +250,6 @@ mostrar_dashboard()
 
 # Rodapé
 st.sidebar.markdown("---")
-if st.sidebar.button("🚪 Sair"):
-    st.session_state.logged_in = False
-    st.session_state.username = None
-    st.session_state.nome_usuario = None
+if st.sidebar.button("🚪 Sair", key="logout"):
+    st.session_state.clear()
     st.rerun()